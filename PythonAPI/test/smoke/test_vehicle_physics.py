@@ -6,66 +6,165 @@
 
 from . import SyncSmokeTest
 from . import SmokeTest
+from . import TESTING_ADDRESS
+from . import VEHICLE_VEHICLES_EXCLUDE_FROM_OLD_TOWNS
 
 import carla
+import itertools
+import operator
 import time
 import math
+import weakref
 import numpy as np
+from collections import deque
 from enum import Enum
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+_xyz = operator.attrgetter('x', 'y', 'z')
+
 def list_equal_tol(objs, tol = 1e-5):
     if (len(objs) < 2):
         return True
 
-    for i in range(1, len(objs)):
-        equal = equal_tol(objs[0], objs[i], tol)
-        if not equal:
-            return False
+    if isinstance(objs[0], carla.libcarla.Vector3D):
+        values = np.array(list(map(_xyz, objs)), dtype=np.float64)
+    else:
+        values = np.asarray(objs, dtype=np.float64)
 
-    return True
+    return bool(np.all(np.abs(values - values[0]) < tol))
 
-def equal_tol(obj_a, obj_b, tol = 1e-5):
-    if isinstance(obj_a, list):
-        return obj_a == obj_b
+def _eq_list(obj_a, obj_b, tol):
+    return obj_a == obj_b
 
-    if isinstance(obj_a, carla.libcarla.Vector3D):
-        diff = abs(obj_a - obj_b)
-        return diff.x < tol and diff.y < tol and diff.z < tol
+def _eq_vec3(obj_a, obj_b, tol):
+    diff = np.subtract(_xyz(obj_a), _xyz(obj_b))
+    return float(np.abs(diff).max()) < tol
 
+def _eq_scalar(obj_a, obj_b, tol):
     return abs(obj_a - obj_b) < tol
 
+# Comparison used by equal_tol for each exact type, anything else is
+# compared as a scalar
+_EQUAL_TOL_DISPATCH = {
+    list: _eq_list,
+    carla.libcarla.Vector3D: _eq_vec3
+}
+
+def equal_tol(obj_a, obj_b, tol = 1e-5):
+    return _EQUAL_TOL_DISPATCH.get(type(obj_a), _eq_scalar)(obj_a, obj_b, tol)
+
+def all_close_to(ref, values, tol):
+    # Returns whether all the values are within tol of ref, together with the
+    # index of the one furthest from it to report on failure
+    diffs = np.abs(np.asarray(values, dtype=np.float64) - ref)
+    i = int(np.argmax(diffs))
+    return bool(diffs[i] < tol), i
+
+# Fields compared by equal_physics_control, split into numeric scalars,
+# Vector3D values (flattened to x, y, z) and anything else (curves, gears).
+# The wheel position is not compared
+_PC_SCALAR_FIELDS = (
+    'max_rpm', 'moi', 'damping_rate_full_throttle',
+    'damping_rate_zero_throttle_clutch_engaged', 'damping_rate_zero_throttle_clutch_disengaged',
+    'use_gear_autobox', 'gear_switch_time', 'clutch_strength', 'final_ratio',
+    'mass', 'drag_coefficient', 'use_sweep_wheel_collision')
+_PC_VECTOR_FIELDS = ('center_of_mass',)
+_PC_OTHER_FIELDS = ('torque_curve', 'forward_gears', 'steering_curve')
+_WHEEL_FIELDS = (
+    'tire_friction', 'damping_rate', 'max_steer_angle', 'radius',
+    'max_brake_torque', 'max_handbrake_torque',
+    'long_stiff_value', 'lat_stiff_max_load', 'lat_stiff_value')
+
+def _control_layout(scalar_keys, vector_keys = (), other_keys = ()):
+    labels = scalar_keys + tuple("%s.%s" % (key, axis) for key in vector_keys for axis in "xyz")
+    getter = operator.attrgetter(*(scalar_keys + vector_keys + other_keys))
+    return (labels, getter, len(scalar_keys), len(vector_keys), other_keys)
+
+_PC_LAYOUT = _control_layout(_PC_SCALAR_FIELDS, _PC_VECTOR_FIELDS, _PC_OTHER_FIELDS)
+_WHEEL_LAYOUT = _control_layout(_WHEEL_FIELDS)
+
+def _split_control(control, layout):
+    # Returns the numeric fields of the control as a float array and the
+    # remaining fields as a tuple
+    labels, getter, num_scalars, num_vectors, _ = layout
+    values = getter(control)
+    vectors = values[num_scalars:num_scalars + num_vectors]
+    numeric = itertools.chain(values[:num_scalars], *map(_xyz, vectors))
+    return np.fromiter(numeric, dtype=np.float64, count=len(labels)), values[num_scalars + num_vectors:]
+
+def _first_mismatch_loop(values_a, values_b, tol):
+    for i in range(values_a.size):
+        if not abs(values_a[i] - values_b[i]) < tol:
+            return i
+    return -1
+
+def _first_mismatch_numpy(values_a, values_b, tol):
+    mismatches = np.flatnonzero(~(np.abs(values_a - values_b) < tol))
+    return int(mismatches[0]) if mismatches.size else -1
+
+# Index of the first pair of values out of tolerance, or -1 if all of them
+# match. The plain loop is compiled with Numba when it is installed, which
+# avoids the temporary arrays of the NumPy version
+if numba is not None:
+    _first_mismatch = numba.njit(cache=True)(_first_mismatch_loop)
+else:
+    _first_mismatch = _first_mismatch_numpy
+
 def equal_physics_control(pc_a, pc_b):
     error_msg = ""
 
-    for key in dir(pc_a):
-        if key.startswith('__') or key == "wheels":
-            continue
+    labels, other_keys = _PC_LAYOUT[0], _PC_LAYOUT[4]
+    num_a, other_a = _split_control(pc_a, _PC_LAYOUT)
+    num_b, other_b = _split_control(pc_b, _PC_LAYOUT)
+    i = _first_mismatch(num_a, num_b, 1e-3)
+    if i >= 0:
+        error_msg = "Car property: '%s' in VehiclePhysicsControl does not match: %.4f %.4f" \
+          % (labels[i], num_a[i], num_b[i])
+        return False, error_msg
 
-        if not equal_tol(getattr(pc_a, key), getattr(pc_b, key), 1e-3):
-            error_msg = "Car property: '%s' in VehiclePhysicsControl does not match: %.4f %.4f" \
-              % (key, getattr(pc_a, key), getattr(pc_b, key))
+    for key, value_a, value_b in zip(other_keys, other_a, other_b):
+        if value_a != value_b:
+            error_msg = "Car property: '%s' in VehiclePhysicsControl does not match: %s %s" \
+              % (key, value_a, value_b)
             return False, error_msg
 
-    if len(pc_a.wheels) != len(pc_b.wheels):
+    # Every access to 'wheels' converts the whole list, so it is read once
+    wheel_list_a, wheel_list_b = pc_a.wheels, pc_b.wheels
+    if len(wheel_list_a) != len(wheel_list_b):
         error_msg = "The number of wheels does not match %d, %d" \
-            % (len(pc_a.wheels) != len(pc_b.wheels))
+            % (len(wheel_list_a), len(wheel_list_b))
         return False, error_msg
 
-    for w in range(0, len(pc_a.wheels)):
-        for key in dir(pc_a.wheels[w]):
-            if key.startswith('__') or key == "position":
-                continue
-
-            if not equal_tol(getattr(pc_a.wheels[w], key), getattr(pc_b.wheels[w], key), 1e-3):
-                error_msg = "Wheel property: '%s' in VehiclePhysicsControl does not match: %.4f %.4f" \
-                % (key, getattr(pc_a.wheels[w], key), getattr(pc_b.wheels[w], key))
-                return False, error_msg
+    if not wheel_list_a:
+        return True, error_msg
+
+    labels = _WHEEL_LAYOUT[0]
+    wheels_a = np.concatenate([_split_control(wheel, _WHEEL_LAYOUT)[0] for wheel in wheel_list_a])
+    wheels_b = np.concatenate([_split_control(wheel, _WHEEL_LAYOUT)[0] for wheel in wheel_list_b])
+    i = _first_mismatch(wheels_a, wheels_b, 1e-3)
+    if i >= 0:
+        w, key = divmod(i, len(labels))
+        error_msg = "Wheel %d property: '%s' in VehiclePhysicsControl does not match: %.4f %.4f" \
+          % (w, labels[key], wheels_a[i], wheels_b[i])
+        return False, error_msg
 
     return True, error_msg
 
+# Last physics control built by change_physics_control for each actor id, so
+# consecutive changes do not fetch the whole control from the server again.
+# Entries live as long as the control object, and destroy_vehicles() drops
+# them explicitly so a reused actor id never starts from a stale control
+_physics_control_cache = weakref.WeakValueDictionary()
+
 def change_physics_control(vehicle, tire_friction = None, drag = None, wheel_sweep = None, long_stiff = None):
     # Change Vehicle Physics Control parameters of the vehicle
-    physics_control = vehicle.get_physics_control()
+    physics_control = _physics_control_cache.get(vehicle.id)
+    if physics_control is None:
+        physics_control = vehicle.get_physics_control()
 
     if drag is not None:
         physics_control.drag_coefficient = drag
@@ -93,8 +192,44 @@ def change_physics_control(vehicle, tire_friction = None, drag = None, wheel_swe
     wheels = [front_left_wheel, front_right_wheel, rear_left_wheel, rear_right_wheel]
     physics_control.wheels = wheels
 
+    _physics_control_cache[vehicle.id] = physics_control
     return physics_control
 
+def destroy_vehicles(client, actor_ids):
+    for actor_id in actor_ids:
+        _physics_control_cache.pop(actor_id, None)
+    client.apply_batch_sync([carla.command.DestroyActor(x) for x in actor_ids])
+
+def get_velocities(world, vehicles, axis='y'):
+    # Reads one velocity component of all the vehicles from the same snapshot
+    snapshot = world.get_snapshot()
+    component = operator.attrgetter(axis)
+    return np.array([component(snapshot.find(x.id).get_velocity()) for x in vehicles])
+
+def get_locations(world, vehicles, axis='y'):
+    # Reads one location component of all the vehicles from the same snapshot
+    snapshot = world.get_snapshot()
+    component = operator.attrgetter(axis)
+    return np.array([component(snapshot.find(x.id).get_transform().location) for x in vehicles])
+
+def get_tire_frictions(vehicles, wheel_idx = 0):
+    # Fetches the physics control of each vehicle once and reads the tire
+    # friction of one of its wheels. The cache of change_physics_control is
+    # not used on purpose, since friction triggers change it on the server
+    return np.array([x.get_physics_control().wheels[wheel_idx].tire_friction for x in vehicles])
+
+def tick_world(world, frames):
+    # Consumes the ticks at C level, without a Python loop body
+    deque(itertools.starmap(world.tick, itertools.repeat((), frames)), maxlen=0)
+
+def set_target_velocities(client, vehicles, velocity):
+    # Applies the same target velocity to all the vehicles in a single batch
+    client.apply_batch_sync([ApplyTargetVelocity(x, velocity) for x in vehicles])
+
+def apply_physics_controls(client, vehicles, physics_controls):
+    # Applies each physics control to its vehicle in a single batch
+    client.apply_batch_sync([ApplyVehiclePhysicsControl(x, pc) for x, pc in zip(vehicles, physics_controls)])
+
 SpawnActor = carla.command.SpawnActor
 FutureActor = carla.command.FutureActor
 ApplyTargetVelocity = carla.command.ApplyTargetVelocity
@@ -103,109 +238,105 @@ ApplyVehicleControl = carla.command.ApplyVehicleControl
 ApplyVehiclePhysicsControl = carla.command.ApplyVehiclePhysicsControl
 
 
-class TestApplyVehiclePhysics(SyncSmokeTest):
+class VehiclePhysicsSmokeTest(SyncSmokeTest):
+    @classmethod
+    def setUpClass(cls):
+        # The blueprint library is the same for every test of the class, so
+        # the vehicle blueprints are filtered only once
+        client = carla.Client(*TESTING_ADDRESS)
+        client.set_timeout(120.0)
+        bp_vehicles = client.get_world().get_blueprint_library().filter("vehicle.*")
+        cls._all_vehicle_bps = list(bp_vehicles)
+        cls._old_town_vehicle_bps = [x for x in cls._all_vehicle_bps
+            if x.id not in VEHICLE_VEHICLES_EXCLUDE_FROM_OLD_TOWNS]
+        cls._four_wheel_bps = [x for x in cls._all_vehicle_bps
+            if int(x.get_attribute('number_of_wheels')) == 4]
+
     def wait(self, frames=100):
-        for _i in range(0, frames):
-            self.world.tick()
+        tick_world(self.world, frames)
 
-    def check_single_physics_control(self, bp_vehicle):
-        veh_tranf = self.world.get_map().get_spawn_points()[0]
 
-        vehicle = self.world.spawn_actor(bp_vehicle, veh_tranf)
+class TestApplyVehiclePhysics(VehiclePhysicsSmokeTest):
+    def check_single_physics_control(self, bp_vehicles, spawn_points):
+        # One vehicle per blueprint, all of them spawned in a single batch at
+        # different spawn points and checked at the same time
+        batch = [SpawnActor(bp, tr) for bp, tr in zip(bp_vehicles, spawn_points)]
+        responses = self.client.apply_batch_sync(batch)
 
-        # Checking the setting of car variables (drag coefficient)
-        pc_a = change_physics_control(vehicle, drag=5)
-        vehicle.apply_physics_control(pc_a)
-        self.wait(2)
-        pc_b = vehicle.get_physics_control()
+        veh_ids = [x.actor_id for x in responses if not x.error]
+        errors = ["%s (%s)" % (bp.id, x.error) for bp, x in zip(bp_vehicles, responses) if x.error]
+        if errors:
+            destroy_vehicles(self.client, veh_ids)
+            self.fail("The test cars could not be correctly spawned: %s" % ", ".join(errors))
 
-        equal, msg = equal_physics_control(pc_a, pc_b)
-        if not equal:
-            self.fail("%s: %s" % (bp_vehicle.id, msg))
+        vehicles = [self.world.get_actor(x) for x in veh_ids]
 
-        self.wait(2)
+        # Checking the setting of car variables (drag coefficient)
+        pc_a = [change_physics_control(x, drag=5) for x in vehicles]
+        self.check_applied_physics_controls(bp_vehicles, vehicles, pc_a)
 
-        # Checking the setting of wheel variables (tire friction)
-        pc_a = change_physics_control(vehicle, tire_friction=5, long_stiff=987)
-        vehicle.apply_physics_control(pc_a)
         self.wait(2)
-        pc_b = vehicle.get_physics_control()
-
-        equal, msg = equal_physics_control(pc_a, pc_b)
-        if not equal:
-            self.fail("%s: %s" % (bp_vehicle.id, msg))
 
-        vehicle.destroy()
+        # Checking the setting of wheel variables (tire friction)
+        pc_a = [change_physics_control(x, tire_friction=5, long_stiff=987) for x in vehicles]
+        self.check_applied_physics_controls(bp_vehicles, vehicles, pc_a)
 
-    def check_multiple_physics_control(self, bp_vehicles, index_bp = None):
-        num_veh = 10
-        vehicles = []
-        pc_a = []
-        pc_b = []
-        for i in range(0, num_veh):
-            veh_tranf = self.world.get_map().get_spawn_points()[i]
-            bp_vehicle = bp_vehicles[index_bp] if index_bp is not None else bp_vehicles[i]
-            vehicles.append(self.world.spawn_actor(bp_vehicle, veh_tranf))
-            drag_coeff = 3.0 + 0.1*i
-            pc_a.append(change_physics_control(vehicles[i], drag=drag_coeff))
-            vehicles[i].apply_physics_control(pc_a[i])
+        destroy_vehicles(self.client, veh_ids)
 
+    def check_applied_physics_controls(self, bp_list, vehicles, pc_a):
+        apply_physics_controls(self.client, vehicles, pc_a)
         self.wait(2)
 
-        for i in range(0, num_veh):
-            pc_b.append(vehicles[i].get_physics_control())
-
-        for i in range(0, num_veh):
-            equal, msg = equal_physics_control(pc_a[i], pc_b[i])
+        for bp_vehicle, vehicle, pc in zip(bp_list, vehicles, pc_a):
+            equal, msg = equal_physics_control(pc, vehicle.get_physics_control())
             if not equal:
                 self.fail("%s: %s" % (bp_vehicle.id, msg))
 
-        pc_a = []
-        pc_b = []
-        for i in range(0, num_veh):
-            friction = 1.0 + 0.1*i
-            lstiff = 500 + 100*i
-            pc_a.append(change_physics_control(vehicles[i], tire_friction=friction, long_stiff=lstiff))
-            vehicles[i].apply_physics_control(pc_a[i])
+    def check_multiple_physics_control(self, bp_vehicles, spawn_points, index_bp = None):
+        num_veh = 10
+        if len(spawn_points) < num_veh:
+            self.fail("The map only has %d spawn points, %d are needed" % (len(spawn_points), num_veh))
+
+        bp_list = [bp_vehicles[index_bp]] * num_veh if index_bp is not None else bp_vehicles[:num_veh]
+        drags = 3.0 + 0.1 * np.arange(num_veh)
+        frictions = 1.0 + 0.1 * np.arange(num_veh)
+        lstiffs = 500.0 + 100.0 * np.arange(num_veh)
 
-        self.wait(2)
+        vehicles = [self.world.spawn_actor(bp, tr) for bp, tr in zip(bp_list, spawn_points)]
 
-        for i in range(0, num_veh):
-            pc_b.append(vehicles[i].get_physics_control())
+        pc_a = [change_physics_control(x, drag=drag) for x, drag in zip(vehicles, drags.tolist())]
+        self.check_applied_physics_controls(bp_list, vehicles, pc_a)
 
-        for i in range(0, num_veh):
-            equal, msg = equal_physics_control(pc_a[i], pc_b[i])
-            if not equal:
-                self.fail("%s: %s" % (bp_vehicle.id, msg))
+        pc_a = [change_physics_control(x, tire_friction=friction, long_stiff=lstiff)
+            for x, friction, lstiff in zip(vehicles, frictions.tolist(), lstiffs.tolist())]
+        self.check_applied_physics_controls(bp_list, vehicles, pc_a)
 
-        for i in range(0, num_veh):
-            vehicles[i].destroy()
+        destroy_vehicles(self.client, [x.id for x in vehicles])
 
     def test_single_physics_control(self):
         print("TestApplyVehiclePhysics.test_single_physics_control")
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = self.filter_vehicles_for_old_towns(bp_vehicles)
-        for bp_veh in bp_vehicles:
-            self.check_single_physics_control(bp_veh)
+        bp_vehicles = self._old_town_vehicle_bps
+        spawn_points = self.world.get_map().get_spawn_points()
+        if not spawn_points:
+            self.fail("The map has no spawn points")
+
+        # As many blueprints per batch as spawn points the map has
+        chunk_size = len(spawn_points)
+        for idx in range(0, len(bp_vehicles), chunk_size):
+            self.check_single_physics_control(bp_vehicles[idx:idx + chunk_size], spawn_points)
 
     def test_multiple_physics_control(self):
         print("TestApplyVehiclePhysics.test_multiple_physics_control")
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = self.filter_vehicles_for_old_towns(bp_vehicles)
+        bp_vehicles = self._old_town_vehicle_bps
+        spawn_points = self.world.get_map().get_spawn_points()
         for idx in range(0, len(bp_vehicles)):
-            self.check_multiple_physics_control(bp_vehicles, idx)
+            self.check_multiple_physics_control(bp_vehicles, spawn_points, idx)
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = self.filter_vehicles_for_old_towns(bp_vehicles)
-        self.check_multiple_physics_control(bp_vehicles)
-
-class TestVehicleFriction(SyncSmokeTest):
-    def wait(self, frames=100):
-        for _i in range(0, frames):
-            self.world.tick()
+        self.check_multiple_physics_control(bp_vehicles, spawn_points)
 
+class TestVehicleFriction(VehiclePhysicsSmokeTest):
     def test_vehicle_zero_friction(self):
         print("TestVehicleFriction.test_vehicle_zero_friction")
         
@@ -213,9 +344,7 @@ class TestVehicleFriction(SyncSmokeTest):
         # workaround: give time to UE4 to clean memory after loading (old assets)
         time.sleep(5)
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = self.filter_vehicles_for_old_towns(bp_vehicles)
-        for bp_veh in bp_vehicles:
+        for bp_veh in self._old_town_vehicle_bps:
 
             veh_transf_00 = carla.Transform(carla.Location(33, -200, 0.2), carla.Rotation(yaw=90))
             veh_transf_01 = carla.Transform(carla.Location(29, -200, 0.7), carla.Rotation(yaw=90))
@@ -246,34 +375,31 @@ class TestVehicleFriction(SyncSmokeTest):
             self.wait(1)
             vel_ref = 100.0 / 3.6
 
-            self.client.apply_batch_sync([
-                ApplyTargetVelocity(veh_refs[0], carla.Vector3D(0, vel_ref, 0)),
-                ApplyTargetVelocity(veh_refs[1], carla.Vector3D(0, vel_ref, 0)),
-            ])
+            set_target_velocities(self.client, veh_refs, carla.Vector3D(0, vel_ref, 0))
 
             self.wait(1)
 
-            vel_veh_00 = veh_refs[0].get_velocity().y
-            vel_veh_01 = veh_refs[1].get_velocity().y
+            vel_veh_00, vel_veh_01 = get_velocities(self.world, veh_refs)
 
-            if not list_equal_tol([vel_ref, vel_veh_00, vel_veh_01], 1e-3):
-                self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            equal, idx = all_close_to(vel_ref, [vel_veh_00, vel_veh_01], 1e-3)
+            if not equal:
+                destroy_vehicles(self.client, veh_ids)
                 
-                self.fail("%s: Velocities are not equal after initialization. Ref: %.3f -> [%.3f, %.3f]"
-                  % (bp_veh.id, vel_ref, vel_veh_00, vel_veh_01))
+                self.fail("%s: Velocities are not equal after initialization. Ref: %.3f -> [%.3f, %.3f] (vehicle %d)"
+                  % (bp_veh.id, vel_ref, vel_veh_00, vel_veh_01, idx))
 
             self.wait(100)
 
-            vel_veh_00 = veh_refs[0].get_velocity().y
-            vel_veh_01 = veh_refs[1].get_velocity().y
+            vel_veh_00, vel_veh_01 = get_velocities(self.world, veh_refs)
 
-            if not list_equal_tol([vel_ref, vel_veh_00, vel_veh_01], 1e-1):
-                self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            equal, idx = all_close_to(vel_ref, [vel_veh_00, vel_veh_01], 1e-1)
+            if not equal:
+                destroy_vehicles(self.client, veh_ids)
 
-                self.fail("%s: Velocities are not equal after simulation. Ref: %.3f -> [%.3f, %.3f]"
-                  % (bp_veh.id, vel_ref, vel_veh_00, vel_veh_01))
+                self.fail("%s: Velocities are not equal after simulation. Ref: %.3f -> [%.3f, %.3f] (vehicle %d)"
+                  % (bp_veh.id, vel_ref, vel_veh_00, vel_veh_01, idx))
 
-            self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            destroy_vehicles(self.client, veh_ids)
 
     def test_vehicle_friction_volume(self):
         print("TestVehicleFriction.test_vehicle_friction_volume")
@@ -327,18 +453,13 @@ class TestVehicleFriction(SyncSmokeTest):
                 ApplyVehiclePhysicsControl(veh_refs[1], change_physics_control(veh_refs[1], tire_friction=friction_ref, drag=0.0))])
             self.wait(1)
 
-            self.client.apply_batch_sync([
-                ApplyTargetVelocity(veh_refs[0], carla.Vector3D(0, vel_ref, 0)),
-                ApplyTargetVelocity(veh_refs[1], carla.Vector3D(0, vel_ref, 0)),
-            ])
+            set_target_velocities(self.client, veh_refs, carla.Vector3D(0, vel_ref, 0))
 
             self.wait(4)
 
             # Before trigger
-            bef_vel_veh_00 = veh_refs[0].get_velocity().y
-            bef_vel_veh_01 = veh_refs[1].get_velocity().y
-            bef_tire_fr_00 = veh_refs[0].get_physics_control().wheels[0].tire_friction
-            bef_tire_fr_01 = veh_refs[1].get_physics_control().wheels[0].tire_friction
+            bef_vel_veh_00, bef_vel_veh_01 = get_velocities(self.world, veh_refs)
+            bef_tire_fr_00, bef_tire_fr_01 = get_tire_frictions(veh_refs)
             extent = carla.Location(100.0, 100.0, 200.0)
             self.world.debug.draw_box(box=carla.BoundingBox(veh_refs[1].get_location(), extent * 1e-2), rotation=vol_transf.rotation, life_time=8, thickness=0.5, color=carla.Color(r=255,g=0,b=0))
 
@@ -352,10 +473,8 @@ class TestVehicleFriction(SyncSmokeTest):
             self.wait(100)
 
             # Inside trigger
-            ins_vel_veh_00 = veh_refs[0].get_velocity().y
-            ins_vel_veh_01 = veh_refs[1].get_velocity().y
-            ins_tire_fr_00 = veh_refs[0].get_physics_control().wheels[0].tire_friction
-            ins_tire_fr_01 = veh_refs[1].get_physics_control().wheels[0].tire_friction
+            ins_vel_veh_00, ins_vel_veh_01 = get_velocities(self.world, veh_refs)
+            ins_tire_fr_00, ins_tire_fr_01 = get_tire_frictions(veh_refs)
 
             extent = carla.Location(100.0, 100.0, 200.0)
             self.world.debug.draw_box(box=carla.BoundingBox(veh_refs[1].get_location(), extent * 1e-2), rotation=vol_transf.rotation, life_time=8, thickness=0.5, color=carla.Color(r=255,g=0,b=0))
@@ -370,22 +489,20 @@ class TestVehicleFriction(SyncSmokeTest):
             self.wait(200)
 
             # Outside trigger
-            out_vel_veh_00 = veh_refs[0].get_velocity().y
-            out_vel_veh_01 = veh_refs[1].get_velocity().y
-            out_tire_fr_00 = veh_refs[0].get_physics_control().wheels[0].tire_friction
-            out_tire_fr_01 = veh_refs[1].get_physics_control().wheels[0].tire_friction
+            out_vel_veh_00, out_vel_veh_01 = get_velocities(self.world, veh_refs)
+            out_tire_fr_00, out_tire_fr_01 = get_tire_frictions(veh_refs)
 
             extent = carla.Location(100.0, 100.0, 200.0)
             self.world.debug.draw_box(box=carla.BoundingBox(veh_refs[1].get_location(), extent * 1e-2), rotation=vol_transf.rotation, life_time=8, thickness=0.5, color=carla.Color(r=255,g=0,b=0))
 
             if not equal_tol(out_vel_veh_00, vel_ref, 1e-3) or not equal_tol(out_tire_fr_00, friction_ref, 1e-3):
                 self.fail("%s: Reference vehicle has changed after trigger. Vel: %.3f [%.3f]. Fric: %.3f [%.3f]"
-                  % (bp_veh.id, ins_vel_veh_00, vel_ref, out_tire_fr_00, friction_ref))
+                  % (bp_veh.id, out_vel_veh_00, vel_ref, out_tire_fr_00, friction_ref))
             if out_vel_veh_01 > vel_ref or not equal_tol(out_tire_fr_01, friction_ref, 1e-3):
                 self.fail("%s: Test vehicle is not correct after trigger. Vel: %.3f [%.3f]. Fric: %.3f [%.3f]"
                   % (bp_veh.id, out_vel_veh_01, vel_ref, out_tire_fr_01, friction_ref))
 
-            self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            destroy_vehicles(self.client, veh_ids)
 
         friction_trigger.destroy()
 
@@ -396,9 +513,7 @@ class TestVehicleFriction(SyncSmokeTest):
         # workaround: give time to UE4 to clean memory after loading (old assets)
         time.sleep(5)
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-
-        for bp_veh in bp_vehicles:
+        for bp_veh in self._all_vehicle_bps:
 
             veh_transf_00 = carla.Transform(carla.Location(35, -200, 0.2), carla.Rotation(yaw=90))
             veh_transf_01 = carla.Transform(carla.Location(29, -200, 0.7), carla.Rotation(yaw=90))
@@ -424,30 +539,21 @@ class TestVehicleFriction(SyncSmokeTest):
                 ApplyVehiclePhysicsControl(veh_refs[0], change_physics_control(veh_refs[0], tire_friction=0.0, drag=0.0)),
                 ApplyVehiclePhysicsControl(veh_refs[1], change_physics_control(veh_refs[1], tire_friction=3.0, drag=0.0))])
 
-            self.wait(1)
-
             vel_ref = 100.0 / 3.6
 
-            self.wait(1)
-            self.client.apply_batch_sync([
-                ApplyTargetVelocity(veh_refs[0], carla.Vector3D(0, vel_ref, 0)),
-                ApplyTargetVelocity(veh_refs[1], carla.Vector3D(0, vel_ref, 0))
-            ])
+            self.wait(2)
+            set_target_velocities(self.client, veh_refs, carla.Vector3D(0, vel_ref, 0))
             self.wait(20)
 
-            vel_veh_00 = veh_refs[0].get_velocity().y
-            loc_veh_00 = veh_refs[0].get_location().y
-            loc_veh_01 = veh_refs[1].get_location().y
+            loc_veh_00, loc_veh_01 = get_locations(self.world, veh_refs)
 
+            brake_control = carla.VehicleControl(brake=1.0)
+            brake_batch = [ApplyVehicleControl(x, brake_control) for x in veh_refs]
             for _i in range(0, 50):
                 self.world.tick()
-                self.client.apply_batch_sync([
-                    ApplyVehicleControl(veh_refs[0], carla.VehicleControl(brake=1.0)),
-                    ApplyVehicleControl(veh_refs[1], carla.VehicleControl(brake=1.0))
-                ])
+                self.client.apply_batch_sync(brake_batch)
 
-            dist_veh_00 = veh_refs[0].get_location().y - loc_veh_00
-            dist_veh_01 = veh_refs[1].get_location().y - loc_veh_01
+            dist_veh_00, dist_veh_01 = get_locations(self.world, veh_refs) - [loc_veh_00, loc_veh_01]
 
             err_veh_01 = dist_veh_01 > dist_veh_00
 
@@ -455,14 +561,10 @@ class TestVehicleFriction(SyncSmokeTest):
                 self.fail("%s: Friction test failed: ErrVeh01: %r -> (%f, %f)"
                     % (bp_veh.id, err_veh_01, dist_veh_00, dist_veh_01))
 
-            self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
-
+            destroy_vehicles(self.client, veh_ids)
 
-class TestVehicleTireConfig(SyncSmokeTest):
-    def wait(self, frames=100):
-        for _i in range(0, frames):
-            self.world.tick()
 
+class TestVehicleTireConfig(VehiclePhysicsSmokeTest):
     def test_vehicle_wheel_collision(self):
         print("TestVehicleTireConfig.test_vehicle_wheel_collision")
 
@@ -470,10 +572,7 @@ class TestVehicleTireConfig(SyncSmokeTest):
         # workaround: give time to UE4 to clean memory after loading (old assets)
         time.sleep(5)
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = [x for x in bp_vehicles if int(x.get_attribute('number_of_wheels')) == 4]
-
-        for bp_veh in bp_vehicles:
+        for bp_veh in self._four_wheel_bps:
             veh_transf_00 = carla.Transform(carla.Location(36, -200, 0.2), carla.Rotation(yaw=91))
             veh_transf_01 = carla.Transform(carla.Location(31, -200, 0.7), carla.Rotation(yaw=91))
 
@@ -500,28 +599,23 @@ class TestVehicleTireConfig(SyncSmokeTest):
                 ApplyVehiclePhysicsControl(veh_refs[1], change_physics_control(veh_refs[1], wheel_sweep = True))])
             self.wait(1)
 
-            self.client.apply_batch_sync([
-                ApplyTargetVelocity(veh_refs[0], carla.Vector3D(0, vel_ref, 0)),
-                ApplyTargetVelocity(veh_refs[1], carla.Vector3D(0, vel_ref, 0))
-            ])
+            set_target_velocities(self.client, veh_refs, carla.Vector3D(0, vel_ref, 0))
             self.wait(150)
 
-            loc_veh_00 = veh_refs[0].get_location().y
-            loc_veh_01 = veh_refs[1].get_location().y
-            vel_veh_00 = veh_refs[0].get_velocity().y
-            vel_veh_01 = veh_refs[1].get_velocity().y
+            loc_veh_00, loc_veh_01 = get_locations(self.world, veh_refs)
+            vel_veh_00, vel_veh_01 = get_velocities(self.world, veh_refs)
 
             if not list_equal_tol([vel_veh_00, vel_veh_01], 0.5):
-                self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+                destroy_vehicles(self.client, veh_ids)
                 self.fail("%s: Velocities are not equal after simulation. [%.3f, %.3f]"
                   % (bp_veh.id, vel_veh_00, vel_veh_01))
 
             if not list_equal_tol([loc_veh_00, loc_veh_01], 0.5):
-                self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+                destroy_vehicles(self.client, veh_ids)
                 self.fail("%s: Locations are not equal after simulation. [%.3f, %.3f]"
                   % (bp_veh.id, loc_veh_00, loc_veh_01))
 
-            self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            destroy_vehicles(self.client, veh_ids)
 
     def test_vehicle_tire_long_stiff(self):
         print("TestVehicleTireConfig.test_vehicle_tire_long_stiff")
@@ -530,10 +624,7 @@ class TestVehicleTireConfig(SyncSmokeTest):
         # workaround: give time to UE4 to clean memory after loading (old assets)
         time.sleep(5)
 
-        bp_vehicles = self.world.get_blueprint_library().filter("vehicle.*")
-        bp_vehicles = [x for x in bp_vehicles if int(x.get_attribute('number_of_wheels')) == 4]
-
-        for bp_veh in bp_vehicles:
+        for bp_veh in self._four_wheel_bps:
             ref_pos = -200
 
             veh_transf_00 = carla.Transform(carla.Location(36 - 0, ref_pos, 0.2), carla.Rotation(yaw=90))
@@ -568,8 +659,7 @@ class TestVehicleTireConfig(SyncSmokeTest):
 
             self.wait(100)
 
-            loc_veh_00 = veh_refs[0].get_location().y
-            loc_veh_01 = veh_refs[1].get_location().y
+            loc_veh_00, loc_veh_01 = get_locations(self.world, veh_refs)
 
             dist_veh_00 = loc_veh_00 - ref_pos
             dist_veh_01 = loc_veh_01 - ref_pos
@@ -578,13 +668,9 @@ class TestVehicleTireConfig(SyncSmokeTest):
                 self.fail("%s: Longitudinal stiffness test failed, check that please. Veh00: [%f] Veh01: [%f]"
                     % (bp_veh.id, dist_veh_00, dist_veh_01))
 
-            self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in veh_ids])
+            destroy_vehicles(self.client, veh_ids)
 
 class TestStickyControl(SyncSmokeTest):
-    def wait(self, frames=100):
-        for _i in range(0, frames):
-            self.world.tick()
-
     def run_scenario(self, bp_veh, veh_control, continous = False, reset_after_first = False, sticky = None):
         ref_pos = -1
         veh_transf = carla.Transform(carla.Location(235, ref_pos, 0.2), carla.Rotation(yaw=90))
@@ -604,17 +690,19 @@ class TestStickyControl(SyncSmokeTest):
         vehicle_id = responses[0].actor_id
         vehicle_00 = self.world.get_actor(vehicle_id)
 
-        for _i in range(0, 10):
-            self.world.tick()
+        tick_world(self.world, 10)
+
+        control_batch = [ApplyVehicleControl(vehicle_00, veh_control)]
+        reset_batch = [ApplyVehicleControl(vehicle_00, carla.VehicleControl())]
 
-        self.client.apply_batch_sync([ApplyVehicleControl(vehicle_00, veh_control)])
+        self.client.apply_batch_sync(control_batch)
         self.world.tick()
 
         for _i in range(0, 150):
             if continous:
-                self.client.apply_batch_sync([ApplyVehicleControl(vehicle_00, veh_control)])
+                self.client.apply_batch_sync(control_batch)
             if reset_after_first:
-                self.client.apply_batch_sync([ApplyVehicleControl(vehicle_00, carla.VehicleControl())])
+                self.client.apply_batch_sync(reset_batch)
             self.world.tick()
 
         loc_veh_00 = vehicle_00.get_location().y